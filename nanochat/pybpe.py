@@ -0,0 +1,473 @@
+"""
+Pure-Python BPE tokenizer in the style of GPT-4.
+
+This is the reference implementation of the training algorithm that rustbpe
+implements natively. It only needs the `regex` and `numpy` packages, so it is
+useful for understanding and debugging the algorithm, and as a fallback in
+environments where the Rust extension is not available. The rustbpe + tiktoken combo in
+tokenizer.py remains the fast path that the speedrun scripts use. Special
+tokens are not handled here; they get inserted by the wrappers in tokenizer.py.
+"""
+
+import os
+import heapq
+from array import array
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import regex as re
+
+# Same split pattern as tokenizer.SPLIT_PATTERN (GPT-4 style, except \p{N}{1,2}
+# instead of \p{N}{1,3}, see the NOTE there). Duplicated here because importing
+# tokenizer.py pulls in the HF/Rust/tiktoken extensions at module scope.
+GPT4_SPLIT_REGEX = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,2}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+"""
+# compile once at import: the regex module caches compiles, but the cache
+# lookup and argument handling still show up when encode() is called in a loop
+# NOTE: the regex engine is the dominant cost of encode_ordinary on large
+# inputs. A hand-coded byte-level state machine can beat it by ~4X, but only
+# when compiled (Cython/C/Rust); in pure Python it is much slower than the
+# engine's C loop. We deliberately don't maintain a second native extension
+# for this: rustbpe is the compiled fast path, this module stays pure Python.
+_SPLIT_RE = re.compile(GPT4_SPLIT_REGEX)
+# bytes-mode twin of the pattern, used as a fast path for ASCII-only text:
+# the subject can then be utf-8 encoded once up front instead of str.encode
+# per chunk. Only valid for ASCII — in bytes mode the engine treats \p{L} and
+# \p{N} as Latin-1, which would mis-split multi-byte utf-8 sequences.
+_SPLIT_RE_BYTES = re.compile(GPT4_SPLIT_REGEX.encode("utf-8"))
+
+
+def _sort_pair_shard(packed, pos):
+    """Group one shard of packed pairs: sort, then find the group boundaries."""
+    if packed.size == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return packed, pos, empty, empty
+    order = np.argsort(packed, kind="stable")
+    sorted_packed = packed[order]
+    sorted_pos = pos[order]
+    cuts = np.nonzero(sorted_packed[1:] != sorted_packed[:-1])[0] + 1
+    starts = np.concatenate(([0], cuts))
+    ends = np.concatenate((cuts, [len(sorted_packed)]))
+    return sorted_packed, sorted_pos, starts, ends
+
+
+def _iter_chunk_bytes(text):
+    """Yield the utf-8 bytes of every split chunk of text."""
+    if text.isascii():
+        yield from (m.group() for m in _SPLIT_RE_BYTES.finditer(text.encode("utf-8")))
+    else:
+        yield from (m.group().encode("utf-8") for m in _SPLIT_RE.finditer(text))
+
+
+def get_stats(ids, counts=None):
+    """
+    Count up the number of times every consecutive pair appears in ids,
+    accumulating into counts (a Counter) when given. Counter.update runs the
+    counting in C (_count_elements) instead of a per-pair Python dict loop.
+    """
+    counts = Counter() if counts is None else counts
+    counts.update(zip(ids, ids[1:]))
+    return counts
+
+
+def merge_token_ids(ids, pair, idx):
+    """Return a new list where every occurrence of pair in ids is replaced by idx."""
+    new_ids = []
+    i = 0
+    n = len(ids)
+    while i < n:
+        if ids[i] == pair[0] and i < n - 1 and ids[i + 1] == pair[1]:
+            new_ids.append(idx)
+            i += 2
+        else:
+            new_ids.append(ids[i])
+            i += 1
+    return new_ids
+
+
+def merge_inplace_token_ids(ids, pair, idx):
+    """
+    Two-pointer in-place variant of merge_token_ids: overwrite the prefix of
+    ids with the merged sequence and return the new length, so the caller can
+    truncate with del ids[new_len:]. No new list gets allocated, and unlike a
+    list.pop(i) based approach this stays linear even when many merges land in
+    the same chunk.
+    """
+    p0, p1 = pair
+    n = len(ids)
+    r = w = 0
+    # skip-by-2: on a non-match, position r+1 can only start a match if it
+    # holds p0, so when it doesn't we copy two tokens per iteration instead of
+    # one, saving about half the comparisons on non-repetitive text. The two
+    # loops are specialized on p0 == p1 purely so the match check stays on top.
+    if p0 == p1:
+        while r < n:
+            if r + 1 < n and ids[r] == p0 and ids[r + 1] == p0:
+                ids[w] = idx
+                r += 2
+            elif r + 1 < n and ids[r + 1] != p0:
+                ids[w] = ids[r]
+                ids[w + 1] = ids[r + 1]
+                w += 1
+                r += 2
+            else:
+                ids[w] = ids[r]
+                r += 1
+            w += 1
+    else:
+        while r < n:
+            if ids[r] == p0 and r + 1 < n and ids[r + 1] == p1:
+                ids[w] = idx
+                r += 2
+            elif r + 1 < n and ids[r + 1] != p0:
+                ids[w] = ids[r]
+                ids[w + 1] = ids[r + 1]
+                w += 1
+                r += 2
+            else:
+                ids[w] = ids[r]
+                r += 1
+            w += 1
+    return w
+
+
+class RegexTokenizer:
+    """GPT-4-style BPE: regex pretokenization into chunks, byte-level merges within them."""
+
+    def __init__(self):
+        self.merges = {}  # (int, int) -> int
+        self.vocab = self._build_vocab()  # int -> bytes
+        self._merge_from = self._build_merge_filter()
+        self._pair_rank = self._build_pair_rank()
+        # real text is Zipfian: the same pretoken chunks (" the", "ing", ...)
+        # recur constantly, so memoize the BPE result per chunk. the cache gets
+        # cleared by train() whenever the merges change.
+        self._encode_chunk_cached = lru_cache(maxsize=65536)(self._encode_chunk_tuple)
+
+    def _build_vocab(self):
+        # dense list indexed by token id rather than a dict: merges are minted
+        # in id order (dicts preserve insertion order), so parents always exist
+        # before their children, and decode gets list indexing instead of a
+        # hash lookup per token
+        vocab = [bytes([idx]) for idx in range(256)]
+        for (p0, p1), idx in self.merges.items():
+            assert idx == len(vocab)
+            vocab.append(vocab[p0] + vocab[p1])
+        return vocab
+
+    def _build_merge_filter(self):
+        # first-token dispatch: filter[a] == 1 iff some merge starts with
+        # token a, so the encode loops can skip the tuple construction and
+        # dict hashing at positions that cannot possibly start a merge
+        filt = bytearray(256 + len(self.merges))
+        for (a, _) in self.merges:
+            filt[a] = 1
+        return filt
+
+    def _build_pair_rank(self):
+        # the merges dict keyed by packed ints instead of tuples: hashing one
+        # int is cheaper than hashing a 2-tuple of ints, and the hot encode
+        # loops then allocate no tuple per probed pair. A dense 2D ranks array
+        # would drop the hashing too, but at V=32768 it would be 4 GB, so the
+        # packed dict is the right point on that curve.
+        return {(a << 32) | b: rank for (a, b), rank in self.merges.items()}
+
+    def get_vocab_size(self):
+        return 256 + len(self.merges)
+
+    def train(self, text, vocab_size, verbose=False):
+        """
+        Train vocab_size - 256 merges on text.
+
+        Instead of recounting every pair over the whole corpus on every merge
+        (O(num_merges * N)), we count pairs once and then maintain the counts
+        incrementally: all chunks live in one flat doubly-linked list of token
+        positions, an index maps each pair to the positions where it occurs,
+        and a lazily-deleted max-heap serves up the most common pair. Each
+        merge then only costs work proportional to the number of occurrences
+        of the merged pair.
+        """
+        assert vocab_size >= 256
+        num_merges = vocab_size - 256
+
+        # split the text up into chunks using the regex pattern and collect
+        # the corpus as one flat byte buffer plus per-chunk lengths
+        # (structure-of-arrays): bytearray.extend keeps the gather at C speed
+        # per chunk, and nothing per-byte ever touches the interpreter here.
+        # finditer instead of findall: stream the chunks one match at a time
+        # rather than materializing a list of every chunk string up front.
+        if text.isascii():
+            # fused fast path: the split pattern partitions the text (every
+            # byte lands in exactly one chunk), so the utf-8 encoded text
+            # already IS the flat buffer laid out in order; only the chunk
+            # lengths need collecting, no per-chunk copies at all
+            buf = text.encode("utf-8")
+            lengths = [m.end() - m.start() for m in _SPLIT_RE_BYTES.finditer(buf)]
+            assert sum(lengths) == len(buf), "split pattern must partition the text"
+        else:
+            buf = bytearray()
+            lengths = []
+            for chunk_bytes in _iter_chunk_bytes(text):
+                buf += chunk_bytes
+                lengths.append(len(chunk_bytes))
+        total = len(buf)
+        tok_arr = np.frombuffer(bytes(buf), dtype=np.uint8).astype(np.int64)
+        # doubly-linked list over the flat positions, with -1 at chunk
+        # boundaries so that merges never cross a chunk boundary
+        nxt_arr = np.arange(1, total + 1, dtype=np.int64)
+        prv_arr = np.arange(-1, total - 1, dtype=np.int64)
+        if lengths:
+            ends = np.cumsum(np.array(lengths, dtype=np.int64)) - 1
+            starts = np.concatenate(([0], ends[:-1] + 1))
+            nxt_arr[ends] = -1
+            prv_arr[starts] = -1
+
+        # count all pairs once, and index the positions where each pair occurs
+        # (a position refers to the first token of the pair). This is done in
+        # NumPy: pack each pair into a single int64 key a * 256 + b, then one
+        # stable argsort groups identical pairs together, giving us both the
+        # counts and the position sets without a Python loop over every byte.
+        pair_count = {}  # (int, int) -> int
+        pair_positions = {}  # (int, int) -> set of positions
+        if total >= 2:
+            # the linked list is laid out contiguously, so position i holds a
+            # pair iff nxt[i] != -1 (i.e. i is not the end of a chunk)
+            pos = np.nonzero(nxt_arr[:-1] != -1)[0]
+            packed = tok_arr[pos] * 256 + tok_arr[pos + 1]
+            # for large corpora, shard the packed pairs and sort the shards on
+            # a thread pool: argsort releases the GIL inside NumPy, so the
+            # sorts genuinely run on all cores. small inputs stay single-shard
+            # to skip the pool overhead.
+            num_shards = (os.cpu_count() or 1) if packed.size >= 1 << 20 else 1
+            if num_shards > 1:
+                bounds = np.linspace(0, packed.size, num_shards + 1).astype(np.int64)
+                with ThreadPoolExecutor(max_workers=num_shards) as pool:
+                    futures = [
+                        pool.submit(_sort_pair_shard, packed[a:b], pos[a:b])
+                        for a, b in zip(bounds[:-1], bounds[1:])
+                    ]
+                    shards = [f.result() for f in futures]
+            else:
+                shards = [_sort_pair_shard(packed, pos)]
+            for sorted_packed, sorted_pos, starts, ends in shards:
+                for s, e in zip(starts.tolist(), ends.tolist()):
+                    key = int(sorted_packed[s])
+                    pair = (key >> 8, key & 0xFF)
+                    if pair in pair_count:
+                        pair_count[pair] += e - s
+                        pair_positions[pair].update(sorted_pos[s:e].tolist())
+                    else:
+                        pair_count[pair] = e - s
+                        pair_positions[pair] = set(sorted_pos[s:e].tolist())
+
+        # the merge phase below mutates single elements at random positions,
+        # which is slow on NumPy scalars; array('i') gives fast enough scalar
+        # access while storing raw 32-bit ints, so the three linked-list
+        # arrays cost 12 bytes per corpus byte instead of 3 PyObject pointers
+        # plus boxed ints (positions fit in int32 for any corpus this pure-
+        # Python trainer can realistically chew through)
+        def as_int32_array(arr):
+            out = array("i")
+            out.frombytes(arr.astype(np.int32, copy=False).tobytes())
+            return out
+        tok = as_int32_array(tok_arr)
+        prv = as_int32_array(prv_arr)
+        nxt = as_int32_array(nxt_arr)
+
+        # max-heap of pair counts with lazy deletion: entries go stale when a
+        # count changes, so every pop gets validated against pair_count. Ties
+        # in count break on the smaller pair, keeping training deterministic.
+        heap = [(-count, pair) for pair, count in pair_count.items()]
+        heapq.heapify(heap)
+
+        pair = None  # the pair currently being merged, see dec() below
+        heappush = heapq.heappush  # bound once: dec/inc push on every count change
+        heappop = heapq.heappop
+
+        def dec(pr, pos):
+            # an occurrence of pair pr at position pos just disappeared
+            if pr == pair:
+                return  # the merged pair's own bookkeeping is dropped wholesale
+            count = pair_count[pr] - 1
+            if count == 0:
+                # drop dead pairs entirely: keeps the dicts from accumulating
+                # zero-count entries over the run, and any heap entries left
+                # behind simply fail validation on pop
+                del pair_count[pr]
+                del pair_positions[pr]
+                return
+            pair_count[pr] = count
+            pair_positions[pr].discard(pos)
+            heappush(heap, (-count, pr))
+
+        def inc(pr, pos):
+            # a new occurrence of pair pr appeared at position pos
+            count = pair_count.get(pr, 0) + 1
+            pair_count[pr] = count
+            pair_positions.setdefault(pr, set()).add(pos)
+            heappush(heap, (-count, pr))
+
+        self.merges = {}
+        vocab = [bytes([idx]) for idx in range(256)]
+        for k in range(num_merges):
+            # pop until we find an entry whose count is still up to date
+            while heap:
+                neg_count, pair = heappop(heap)
+                if pair_count.get(pair) == -neg_count:
+                    break
+            else:
+                break  # no pairs left to merge
+            count = -neg_count
+            a, b = pair
+            idx = 256 + k
+            # merge left to right at every occurrence of the pair. sorting
+            # matches the greedy left-to-right semantics of a linear scan for
+            # overlapping runs (e.g. "aaa"), where stale positions get skipped.
+            positions = sorted(pair_positions.pop(pair))
+            del pair_count[pair]
+            for i in positions:
+                j = nxt[i]
+                if tok[i] != a or j == -1 or tok[j] != b:
+                    continue  # stale: an earlier merge this round consumed a neighbor
+                p, n2 = prv[i], nxt[j]
+                # the neighbor pairs around the occurrence disappear...
+                if p != -1:
+                    dec((tok[p], a), p)
+                if n2 != -1:
+                    dec((b, tok[n2]), j)
+                # ...splice out j and write the new token at i...
+                tok[i] = idx
+                nxt[i] = n2
+                if n2 != -1:
+                    prv[n2] = i
+                tok[j] = -1  # tombstone, so stale positions fail the check above
+                # ...and the new neighbor pairs appear
+                if p != -1:
+                    inc((tok[p], idx), p)
+                if n2 != -1:
+                    inc((idx, tok[n2]), i)
+            # save the merge
+            self.merges[pair] = idx
+            vocab.append(vocab[a] + vocab[b])
+            if verbose:
+                print(f"merge {k+1}/{num_merges}: {pair} -> {idx} ({vocab[idx]}) had {count} occurrences")
+        self.vocab = vocab
+        self._merge_from = self._build_merge_filter()
+        self._pair_rank = self._build_pair_rank()
+        self._encode_chunk_cached.cache_clear()  # merges changed, cached encodes are stale
+
+    def encode_ordinary(self, text):
+        """Encode text into token ids, ignoring any special tokens."""
+        ids = []
+        for chunk_bytes in _iter_chunk_bytes(text):
+            ids.extend(self._encode_chunk_cached(chunk_bytes))
+        return ids
+
+    def _encode_chunk_tuple(self, chunk_bytes):
+        # tuple so the cached value is immutable
+        return tuple(self._encode_chunk(chunk_bytes))
+
+    def _encode_chunk(self, chunk_bytes):
+        # apply the merges in the order we learned them (lowest rank first)
+        ids = list(chunk_bytes)
+        if len(ids) > 500:
+            # pathological chunks (very long "words") make the rescan loop
+            # below quadratic; they take the O(L log L) heap path instead
+            return self._encode_chunk_heap(ids)
+        if len(ids) < 32:
+            # ...and the typical pretoken is only a few bytes, where even
+            # building the stats dict per pass is pure overhead
+            return self._encode_chunk_small(ids)
+        while len(ids) >= 2:
+            stats = get_stats(ids)
+            pair = min(stats, key=lambda p: self.merges.get(p, float("inf")))
+            if pair not in self.merges:
+                break  # nothing else can be merged
+            new_len = merge_inplace_token_ids(ids, pair, self.merges[pair])
+            del ids[new_len:]
+        return ids
+
+    def _encode_chunk_small(self, ids):
+        """
+        Short-chunk fast path: scan the ids once per merge tracking the
+        best-ranked pair inline, merge that single occurrence, repeat. No
+        stats dict gets built and discarded per pass. The rank of a merge is
+        also the id of the token it produces.
+        """
+        rank_get = self._pair_rank.get
+        can_start = self._merge_from
+        inf = float("inf")
+        while len(ids) >= 2:
+            best_rank = inf
+            best_i = -1
+            for i in range(len(ids) - 1):
+                if not can_start[ids[i]]:
+                    continue
+                rank = rank_get((ids[i] << 32) | ids[i + 1], inf)
+                if rank < best_rank:
+                    best_rank = rank
+                    best_i = i
+            if best_i == -1:
+                break  # nothing else can be merged
+            ids[best_i] = best_rank
+            del ids[best_i + 1]
+        return ids
+
+    def _encode_chunk_heap(self, ids):
+        """
+        Encode one chunk with a doubly-linked list over ids plus a min-heap of
+        (merge rank, position) for every mergeable adjacent pair, instead of
+        rescanning the whole remaining chunk per merge. Entries go stale when
+        a neighbor gets merged, so each pop re-derives the rank of the pair
+        currently at that position and skips on mismatch. Note that the rank
+        of a merge is also the id of the token it produces.
+        """
+        rank_get = self._pair_rank.get
+        heappush, heappop = heapq.heappush, heapq.heappop
+        n = len(ids)
+        tok = ids
+        prv = list(range(-1, n - 1))
+        nxt = list(range(1, n + 1))
+        nxt[-1] = -1
+        can_start = self._merge_from
+        heap = []
+        for i in range(n - 1):
+            if not can_start[tok[i]]:
+                continue
+            rank = rank_get((tok[i] << 32) | tok[i + 1])
+            if rank is not None:
+                heap.append((rank, i))
+        heapq.heapify(heap)
+        while heap:
+            rank, i = heappop(heap)
+            j = nxt[i]
+            if j == -1 or rank_get((tok[i] << 32) | tok[j]) != rank:
+                continue  # stale entry
+            # splice out j and write the merged token at i
+            p, n2 = prv[i], nxt[j]
+            tok[i] = rank
+            tok[j] = -1  # tombstone, fails the pair check above
+            nxt[i] = n2
+            if n2 != -1:
+                prv[n2] = i
+            # the two new neighbor pairs may be mergeable
+            if p != -1:
+                r = rank_get((tok[p] << 32) | rank)
+                if r is not None:
+                    heappush(heap, (r, p))
+            if n2 != -1:
+                r = rank_get((rank << 32) | tok[n2])
+                if r is not None:
+                    heappush(heap, (r, i))
+        return [t for t in tok if t != -1]
+
+    def decode(self, ids):
+        # accumulate into one growable buffer: b"".join over a generator first
+        # materializes every element, whereas += on a bytearray is a single
+        # C-level append per token with amortized resizing
+        vocab = self.vocab  # local alias, skips the attribute lookup per token
+        out = bytearray()
+        for idx in ids:
+            out += vocab[idx]
+        return out.decode("utf-8", errors="replace")
@@ -0,0 +1,206 @@
+"""
+Test the pure-Python BPE tokenizer against a brute-force reference.
+
+python -m pytest tests/test_pybpe.py -v
+"""
+
+from collections import Counter
+
+import regex as re
+
+from nanochat.pybpe import (
+    RegexTokenizer,
+    GPT4_SPLIT_REGEX,
+    get_stats,
+    merge_token_ids,
+    merge_inplace_token_ids,
+)
+
+# small mixed corpus: english prose, some code-ish text, numbers, unicode
+SAMPLE_TEXT = """
+The quick brown fox jumps over the lazy dog. The dog, unimpressed, went back
+to sleep. I'm sure you're aware that it's the fox's favorite pastime in 2025.
+
+def train(self, text, vocab_size, verbose=False):
+    assert vocab_size >= 256
+    num_merges = vocab_size - 256
+
+Numbers: 123, 4567, 89. Special chars: @#$%^&*()
+Unicode: 你好世界 🌍 안녕하세요
+""".strip()
+
+
+def reference_train(text, vocab_size):
+    """Naive O(num_merges * N) BPE trainer that recounts pairs every iteration."""
+    chunks = [list(c.encode("utf-8")) for c in re.findall(GPT4_SPLIT_REGEX, text)]
+    merges = {}
+    for k in range(vocab_size - 256):
+        stats = Counter()
+        for chunk in chunks:
+            get_stats(chunk, stats)
+        if not stats:
+            break
+        # highest count wins, ties break on the smaller pair (same as RegexTokenizer)
+        pair = min(stats, key=lambda p: (-stats[p], p))
+        idx = 256 + k
+        chunks = [merge_token_ids(chunk, pair, idx) for chunk in chunks]
+        merges[pair] = idx
+    return merges
+
+
+class TestPretokenize:
+
+    def test_bytes_fast_path_matches_str_engine(self):
+        """The ASCII bytes-mode split must chunk exactly like the str-mode engine."""
+        from nanochat.pybpe import _iter_chunk_bytes
+        texts = [
+            "Hello world! I'm 99% sure it's fine.\n  def f(x):\n    return 12345\n",
+            "tabs\tand\r\nnewlines   ",
+            "mixed ascii and 유니코드 🌍",  # falls back to the str engine
+        ]
+        for text in texts:
+            expected = [c.encode("utf-8") for c in re.findall(GPT4_SPLIT_REGEX, text)]
+            assert list(_iter_chunk_bytes(text)) == expected
+
+
+class TestMergeKernel:
+
+    def test_inplace_matches_new_list(self):
+        """The in-place two-pointer kernel must agree with merge_token_ids."""
+        cases = [
+            [1, 2, 3, 1, 2, 1],
+            [1, 1, 1, 1, 1],  # overlapping runs merge greedily left to right
+            [1, 1, 2, 1, 1],
+            [2, 2, 2, 1],
+            [3, 1, 2, 2, 1, 2],
+            [1, 2],
+            [2, 1],
+            [1],
+            [],
+        ]
+        for ids in cases:
+            for pair in [(1, 2), (1, 1)]:
+                expected = merge_token_ids(ids, pair, 4)
+                buf = list(ids)
+                new_len = merge_inplace_token_ids(buf, pair, 4)
+                assert buf[:new_len] == expected
+
+
+class TestTrain:
+
+    def test_matches_reference(self):
+        """The incremental trainer must learn exactly the same merges as the naive one."""
+        tokenizer = RegexTokenizer()
+        tokenizer.train(SAMPLE_TEXT, 256 + 50)
+        expected = reference_train(SAMPLE_TEXT, 256 + 50)
+        assert tokenizer.merges == expected
+
+    def test_stops_when_no_pairs_left(self):
+        """Asking for more merges than the text supports must not crash."""
+        tokenizer = RegexTokenizer()
+        tokenizer.train("ab ab", 512)
+        assert len(tokenizer.merges) < 512 - 256
+        assert tokenizer.get_vocab_size() == 256 + len(tokenizer.merges)
+
+    def test_sharded_pair_count_merges(self):
+        """Counting shards independently and merging must equal one global count."""
+        import numpy as np
+        from nanochat.pybpe import _sort_pair_shard
+
+        rng = np.random.default_rng(0)
+        packed = rng.integers(0, 50, size=1000, dtype=np.int64)
+        pos = np.arange(1000, dtype=np.int64)
+
+        def collect(shards):
+            count, positions = {}, {}
+            for sorted_packed, sorted_pos, starts, ends in shards:
+                for s, e in zip(starts.tolist(), ends.tolist()):
+                    key = int(sorted_packed[s])
+                    count[key] = count.get(key, 0) + (e - s)
+                    positions.setdefault(key, set()).update(sorted_pos[s:e].tolist())
+            return count, positions
+
+        whole = collect([_sort_pair_shard(packed, pos)])
+        split = collect([
+            _sort_pair_shard(packed[:300], pos[:300]),
+            _sort_pair_shard(packed[300:], pos[300:]),
+        ])
+        assert whole == split
+
+    def test_ties_break_on_smaller_pair(self):
+        """With equal counts, the smaller pair must win, with no rescan of the stats."""
+        tokenizer = RegexTokenizer()
+        # chunks: "ab", " cd", " ab", " cd" -> (32,99), (97,98), (99,100) all
+        # have count 2; the smallest pair (32,99) must be merged first
+        tokenizer.train("ab cd ab cd", 256 + 1)
+        assert list(tokenizer.merges) == [(32, 99)]
+
+    def test_is_deterministic(self):
+        """Two training runs on the same text must produce identical merges."""
+        t1, t2 = RegexTokenizer(), RegexTokenizer()
+        t1.train(SAMPLE_TEXT, 256 + 30)
+        t2.train(SAMPLE_TEXT, 256 + 30)
+        assert t1.merges == t2.merges
+
+
+class TestEncodeDecode:
+
+    def test_roundtrip(self):
+        tokenizer = RegexTokenizer()
+        tokenizer.train(SAMPLE_TEXT, 256 + 50)
+        for text in [SAMPLE_TEXT, "Hello world!", "I'm 99% sure it's fine.", "🌍 지구"]:
+            ids = tokenizer.encode_ordinary(text)
+            assert tokenizer.decode(ids) == text
+
+    def test_heap_path_matches_rescan_loop(self):
+        """Long chunks take the heap path; it must agree with the simple loop."""
+        tokenizer = RegexTokenizer()
+        tokenizer.train(SAMPLE_TEXT, 256 + 50)
+        for chunk in [b"the" * 300, b"abcd" * 200, b"x" * 777]:
+            via_heap = tokenizer._encode_chunk_heap(list(chunk))
+            # the rescan loop, inlined here so the test doesn't depend on the gate
+            ids = list(chunk)
+            while len(ids) >= 2:
+                stats = get_stats(ids)
+                pair = min(stats, key=lambda p: tokenizer.merges.get(p, float("inf")))
+                if pair not in tokenizer.merges:
+                    break
+                ids = merge_token_ids(ids, pair, tokenizer.merges[pair])
+            assert via_heap == ids
+
+    def test_small_path_matches_rescan_loop(self):
+        """Short chunks take the inline-scan path; it must agree with the simple loop."""
+        tokenizer = RegexTokenizer()
+        tokenizer.train(SAMPLE_TEXT, 256 + 50)
+        for chunk in [b" the", b"fox's", b"jumps", b"a", b"", b"unimpressed"]:
+            via_small = tokenizer._encode_chunk_small(list(chunk))
+            ids = list(chunk)
+            while len(ids) >= 2:
+                stats = get_stats(ids)
+                pair = min(stats, key=lambda p: tokenizer.merges.get(p, float("inf")))
+                if pair not in tokenizer.merges:
+                    break
+                ids = merge_token_ids(ids, pair, tokenizer.merges[pair])
+            assert via_small == ids
+
+    def test_roundtrip_untrained(self):
+        """With no merges, encoding is just raw utf-8 bytes."""
+        tokenizer = RegexTokenizer()
+        ids = tokenizer.encode_ordinary("hi there")
+        assert ids == list("hi there".encode("utf-8"))
+        assert tokenizer.decode(ids) == "hi there"
+
+    def test_empty_string(self):
+        tokenizer = RegexTokenizer()
+        assert tokenizer.encode_ordinary("") == []
+        assert tokenizer.decode([]) == ""
+
+    def test_chunk_cache_invalidated_by_train(self):
+        """Retraining must not serve encodes cached under the old merges."""
+        tokenizer = RegexTokenizer()
+        before = tokenizer.encode_ordinary("the the the")  # raw bytes, no merges yet
+        tokenizer.train("the the the the", 256 + 5)
+        after = tokenizer.encode_ordinary("the the the")
+        assert before == list("the the the".encode("utf-8"))
+        assert after != before
+        assert tokenizer.decode(after) == "the the the"